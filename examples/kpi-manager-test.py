@@ -7,13 +7,16 @@
 # (For testing KPI ATTACH)
 # Example4: python kpi-manager-test.py logs/data_sample.mi2log 
 # (For testing KPI DL_TPUT)
-# import os
+# Example5: python kpi-manager-test.py logs/attach_sample.mi2log logs/mobility_sample.mi2log
+# (Several independent traces, each replayed in its own process)
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from mobile_insight.monitor import OfflineReplayer
 # from mobile_insight.analyzer import LteMacAnalyzer, LtePdcpGapAnalyzer
+from mobile_insight.analyzer import Analyzer
 from mobile_insight.analyzer.kpi import KPIManager, KpiAnalyzer
-import cProfile
 
 
 def kpi_manager_example(path):
@@ -26,34 +29,56 @@ def kpi_manager_example(path):
 
     kpi_manager.enable_kpi("KPI.Accessibility.DEDICATED_BEARER_SR_QCI1_REQ", periodicity='10m')
     kpi_manager.enable_kpi("KPI.Accessibility.DEDICATED_BEARER_SR_QCI1_SR", periodicity='2h')
-    kpi_manager.enable_kpi("KPI.Accessibility.RRC_SUC")
     kpi_manager.enable_kpi("KPI.Accessibility.RRC_SR", cell='22205186')
     # kpi_manager.enable_kpi("KPI.Accessibility.SR_SUC", periodicity='1h')
     kpi_manager.enable_kpi("KPI.Accessibility.SR_SR", periodicity='1h')
-    # kpi_manager.enable_kpi("KPI.Accessibility.ATTACH_SUC")
-    kpi_manager.enable_kpi("KPI.Accessibility.ATTACH_SR")
-
-    # Test Mobility KPIs
-    # kpi_manager.enable_kpi("KPI.Mobility.HO_TOTAL")
-    kpi_manager.enable_kpi("KPI.Mobility.HO_SR")
     # kpi_manager.enable_kpi("KPI.Mobility.HO_TOTAL", periodicity='1h')
     # kpi_manager.enable_kpi("KPI.Mobility.HO_FAILURE", periodicity='1h')
     kpi_manager.enable_kpi("KPI.Mobility.TAU_SR", periodicity='1h')
     # kpi_manager.enable_kpi("KPI.Mobility.TAU_REQ", periodicity='1h')
 
-    # Test Retainability KPIs
-    kpi_manager.enable_kpi("KPI.Retainability.RRC_AB_REL") 
-
-    # Test Integrity KPIs
-    kpi_manager.enable_kpi("KPI.Integrity.DL_TPUT") 
+    # KPIs with default settings are enabled in one batch
+    kpi_manager.enable_kpis([
+        "KPI.Accessibility.RRC_SUC",
+        # "KPI.Accessibility.ATTACH_SUC",
+        "KPI.Accessibility.ATTACH_SR",
+        # Test Mobility KPIs
+        # "KPI.Mobility.HO_TOTAL",
+        "KPI.Mobility.HO_SR",
+        # Test Retainability KPIs
+        "KPI.Retainability.RRC_AB_REL",
+        # Test Integrity KPIs
+        "KPI.Integrity.DL_TPUT",
+    ])
 
     kpi_manager.set_source(src)
 
     src.run()
 
 
+def kpi_manager_worker(path):
+    # Pool workers are reused across traces, and analyzers are registered
+    # process-wide: drop the previous trace's analyzers so that their state
+    # does not leak into this one
+    Analyzer.reset()
+    # Pool workers exit without running atexit handlers, so the final KPI
+    # batch is never committed automatically: flush it once the replay ends.
+    # All workers also write to the same local KPI database, so commit every
+    # KPI to keep each worker's write transaction short
+    KpiAnalyzer.commit_batch = 1
+    kpi_manager_example(path)
+    KpiAnalyzer.flush_kpi()
+    return path
+
+
 if __name__ == '__main__':
-    kpi_manager_example(sys.argv[1])
+    if len(sys.argv) > 2:
+        with ProcessPoolExecutor(max_workers=min(len(sys.argv) - 1, os.cpu_count() or 1)) as executor:
+            futures = [executor.submit(kpi_manager_worker, path) for path in sys.argv[1:]]
+            for future in as_completed(futures):
+                print("Finished: " + future.result())
+    else:
+        kpi_manager_example(sys.argv[1])
 
 
 
@@ -9,10 +9,14 @@ Author: Zhehui Zhang
 
 __all__ = ["AttachSrAnalyzer"]
 
+import re
 try:
-    import xml.etree.cElementTree as ET
+    from lxml import etree as ET
 except ImportError:
-    import xml.etree.ElementTree as ET
+    try:
+        import xml.etree.cElementTree as ET
+    except ImportError:
+        import xml.etree.ElementTree as ET
 from .kpi_analyzer import KpiAnalyzer
 
 # full list refer to Table 9.9.3.9.1 in TS 24.301
@@ -35,6 +39,40 @@ EMM_cause = {'3': 'ILL_UE',
              '39': 'CS_NOT_AVAIL',
              '40': 'NO_EPS_ACTIVATED'}
 
+# EMM causes tracked for attach reject: cause show value -> reject counter
+ATTACH_REJECT_cause = dict((str(cause_idx), EMM_cause[str(cause_idx)])
+                           for cause_idx in [3, 6, 7, 8] + list(range(11, 16)) + [18, 19, 22, 25, 35])
+
+# show value of the EPS attach type IE -> attach type counter
+EPS_attach_type = {'0': 'EMERGENCY',
+                   '1': 'NORMAL',
+                   '2': 'COMBINED'}
+
+# <field> tag of the EMM message type and its show attribute in the raw Msg
+EMM_TYPE_FIELD = re.compile(r'<field [^>]*name="nas_eps\.nas_msg_emm_type"[^>]*>')
+SHOW_ATTR = re.compile(r' show="([^"]*)"')
+
+# handler entry of the EMM message types that are not handled: no handler, no fields
+NO_EMM_HANDLER = (None, frozenset())
+
+
+def has_emm_type(msg_xml, emm_types):
+    """
+    Check the raw Msg for an EMM message type of interest without parsing it
+
+    :param msg_xml: the Msg field of a decoded NAS EMM OTA log
+    :type msg_xml: string
+    :param emm_types: show values of nas_eps.nas_msg_emm_type to look for
+    :type emm_types: set
+    :returns: True if the message carries one of emm_types, False otherwise
+    """
+    for tag in EMM_TYPE_FIELD.findall(msg_xml):
+        show = SHOW_ATTR.search(tag)
+        if show and show.group(1) in emm_types:
+            return True
+    return False
+
+
 class AttachSrAnalyzer(KpiAnalyzer):
     """
     An KPI analyzer to monitor and manage RRC connection success rate
@@ -50,8 +88,8 @@ class AttachSrAnalyzer(KpiAnalyzer):
                                  'reject_number': {}}
         # self.current_kpi = {'EMERGENCY': 0, 'NORMAL': 0, 'COMBINED': 0}
 
-        for cause_idx in [3, 6, 7, 8] + list(range(11, 16)) + [18, 19, 22, 25, 35]:
-            self.kpi_measurements['reject_number'][EMM_cause[str(cause_idx)]] = 0
+        for cause in ATTACH_REJECT_cause.values():
+            self.kpi_measurements['reject_number'][cause] = 0
 
         self.register_kpi("Accessibility", "ATTACH_SUC", self.__emm_sr_callback,
                           list(self.kpi_measurements['success_number'].keys()))
@@ -66,6 +104,26 @@ class AttachSrAnalyzer(KpiAnalyzer):
         self.type = None # record attach casue of current attach procedure
         self.attach_req_timestamp = None
 
+        self.__fields = {} # name -> field of the current message, reused across messages
+
+        # (msg.type_id, show of nas_eps.nas_msg_emm_type)
+        #     -> (handler, fields it reads besides the message type)
+        self.__emm_handlers = {
+            ("LTE_NAS_EMM_OTA_Incoming_Packet", '66'): (self.__on_attach_accept, frozenset()),
+            ("LTE_NAS_EMM_OTA_Incoming_Packet", '68'): (self.__on_attach_reject,
+                                                        frozenset(["nas_eps.emm.cause"])),
+            ("LTE_NAS_EMM_OTA_Outgoing_Packet", '65'): (self.__on_attach_request,
+                                                        frozenset(["nas_eps.emm.eps_att_type"])),
+            ("LTE_NAS_EMM_OTA_Outgoing_Packet", '67'): (self.__on_attach_complete, frozenset()),
+        }
+        # fields read by the callback
+        self.__attach_fields = frozenset(["nas_eps.nas_msg_emm_type"]).union(
+            *[needed for _, needed in self.__emm_handlers.values()])
+        # msg.type_id -> show values of nas_eps.nas_msg_emm_type handled in that direction
+        self.__emm_types = {}
+        for type_id, emm_type in self.__emm_handlers:
+            self.__emm_types.setdefault(type_id, set()).add(emm_type)
+
         # add callback function
         self.add_source_callback(self.__emm_sr_callback)
 
@@ -104,84 +162,96 @@ class AttachSrAnalyzer(KpiAnalyzer):
             # self.cell_id = cell_id
             # self.__clear_counters()
 
-        if msg.type_id == "LTE_NAS_EMM_OTA_Incoming_Packet":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
-            if 'Msg' in log_item_dict:
-                log_xml = ET.XML(log_item_dict['Msg'])
-                # ET.dump(log_xml)
-                for proto in log_xml.iter('proto'):
-                    if proto.get('name') == 'nas-eps':
-                        for field in proto.iter('field'):
-                            # if field.get('name') == "nas_eps.nas_msg_emm_type":
-                                # showing '66' indicates Attach acccept, referring to http://niviuk.free.fr/lte_nas.php
-                                if field.get('show') == '66' and self.attach_req_timestamp:
-                                    if self.type in self.kpi_measurements['success_number']:
-                                        self.kpi_measurements['success_number'][self.type] += 1
-                                        self.store_kpi("KPI_Accessibility_ATTACH_SUC",
-                                                       self.kpi_measurements['success_number'], log_item_dict['timestamp'])
-                                        upload_dict = {
-                                            'total_number': self.kpi_measurements['total_number'],
-                                            'success_number': self.kpi_measurements['success_number']}
-                                        # self.upload_kpi('KPI.Accessibility.ATTACH_SR', upload_dict)
-                                        self.attach_req_timestamp = None
-                                    # self.__calculate_kpi()
-                                    # self.store_kpi("KPI_Accessibility_ATTACH_SR_" + self.type, \
-                                                   # '{:.2f}'.format(self.current_kpi[self.type]), msg.timestamp)
-
-                                # '41' indicates Attach reject
-                                # TODO: support attach reject
-                                elif field.get('value') == '41':
-                                    for child_field in proto.iter('field'):
-                                        if child_field.get('name') == 'nas_eps.emm.cause':
-                                            cause_idx = str(child_field.get('show'))
-                                            if cause_idx in EMM_cause:
-                                                self.kpi_measurements['reject_number'][EMM_cause[cause_idx]] += 1
-                                                # self.store_kpi("KPI_Retainability_ATTACH_REJ",
-                                                               # self.kpi_measurements['reject_number'], msg.timestamp)
-                                                upload_dict = {
-                                                    'total_number': self.kpi_measurements['total_number'],
-                                                    'reject_number': self.kpi_measurements['reject_number']}
-                                                # self.upload_kpi('KPI.Retainability.ATTACH_REJ', upload_dict)
-                                            else:
-                                                self.log_warning("Unknown EMM cause: " + cause_idx)
-
-        elif msg.type_id == "LTE_NAS_EMM_OTA_Outgoing_Packet":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
-            if 'Msg' in log_item_dict:
-                log_xml = ET.XML(log_item_dict['Msg'])
-                # ET.dump(log_xml)
-                for field in log_xml.iter('field'):
-                    if field.get('name') == "nas_eps.emm.eps_att_type":
-                        if field.get('show') == '2':
-                            self.type = 'COMBINED'
-                            self.kpi_measurements['total_number'][self.type] += 1
-                        elif field.get('show') == '1':
-                            self.type = 'NORMAL'
-                            self.kpi_measurements['total_number'][self.type] += 1
-                        elif field.get('show') == '0':
-                            self.type = 'EMERGENCY'
-                            self.kpi_measurements['total_number'][self.type] += 1
-                        self.store_kpi("KPI_Accessibility_ATTACH_REQ",
-                                       self.kpi_measurements['total_number'], log_item_dict['timestamp'])
-                    elif field.get('name') == "nas_eps.nas_msg_emm_type":
-                        if field.get('show') == '65':
-                            # Attach request, referring to http://niviuk.free.fr/lte_nas.php
-                            self.attach_req_timestamp = log_item_dict['timestamp']
-
-                        if field.get('show') == '67':
-                            # Attach complete, referring to http://niviuk.free.fr/lte_nas.php
-                            if self.attach_req_timestamp:
-                                delta = (log_item_dict['timestamp'] - self.attach_req_timestamp).total_seconds()
-                                if delta >=0:
-                                    upload_dict = {'latency': delta}
-                                    # self.upload_kpi("KPI.Accessibility.ATTACH_LATENCY", upload_dict)
+        emm_types = self.__emm_types.get(msg.type_id)
+        if emm_types is None:
+            return 0
+
+        log_item_dict = msg.data.decode()
+        # skip the XML parse for messages without an EMM message type of interest
+        msg_xml = log_item_dict.get('Msg')
+        if not msg_xml or not has_emm_type(msg_xml, emm_types):
+            return 0
+
+        log_xml = ET.XML(msg_xml)
+        # ET.dump(log_xml)
+        # walk the fields once, stopping as soon as the fields needed by the
+        # message type (which comes first) are seen, then dispatch on the EMM message type
+        fields = self.__fields
+        fields.clear()
+        needed = None
+        for field in log_xml.iter('field'):
+            name = field.get('name')
+            if name in self.__attach_fields:
+                fields[name] = field
+                if name == "nas_eps.nas_msg_emm_type":
+                    needed = self.__emm_handlers.get((msg.type_id, field.get('show')),
+                                                     NO_EMM_HANDLER)[1]
+                if needed is not None and fields.keys() >= needed:
+                    break
 
+        emm_type = fields.get("nas_eps.nas_msg_emm_type")
+        if emm_type is not None:
+            handler = self.__emm_handlers.get((msg.type_id, emm_type.get('show')),
+                                              NO_EMM_HANDLER)[0]
+            if handler:
+                handler(msg, log_item_dict, fields)
+        # do not keep the parsed tree alive until the next message
+        fields.clear()
 
         return 0
 
+    def __on_attach_accept(self, msg, log_item_dict, fields):
+        # showing '66' indicates Attach acccept, referring to http://niviuk.free.fr/lte_nas.php
+        if self.attach_req_timestamp and self.type in self.kpi_measurements['success_number']:
+            self.kpi_measurements['success_number'][self.type] += 1
+            self.store_kpi("KPI_Accessibility_ATTACH_SUC",
+                           self.kpi_measurements['success_number'], log_item_dict['timestamp'])
+            upload_dict = {
+                'total_number': self.kpi_measurements['total_number'],
+                'success_number': self.kpi_measurements['success_number']}
+            # self.upload_kpi('KPI.Accessibility.ATTACH_SR', upload_dict)
+            self.attach_req_timestamp = None
+            # self.__calculate_kpi()
+            # self.store_kpi("KPI_Accessibility_ATTACH_SR_" + self.type, \
+                           # '{:.2f}'.format(self.current_kpi[self.type]), msg.timestamp)
 
+    def __on_attach_reject(self, msg, log_item_dict, fields):
+        # showing '68' indicates Attach reject
+        cause_field = fields.get('nas_eps.emm.cause')
+        if cause_field is None:
+            return
+        cause_idx = str(cause_field.get('show'))
+        cause = ATTACH_REJECT_cause.get(cause_idx)
+        if cause:
+            self.kpi_measurements['reject_number'][cause] += 1
+            # self.store_kpi("KPI_Retainability_ATTACH_REJ",
+                           # self.kpi_measurements['reject_number'], msg.timestamp)
+            upload_dict = {
+                'total_number': self.kpi_measurements['total_number'],
+                'reject_number': self.kpi_measurements['reject_number']}
+            # self.upload_kpi('KPI.Retainability.ATTACH_REJ', upload_dict)
+        elif cause_idx in EMM_cause:
+            self.log_warning("Untracked EMM cause: " + EMM_cause[cause_idx])
+        else:
+            self.log_warning("Unknown EMM cause: " + cause_idx)
 
+    def __on_attach_request(self, msg, log_item_dict, fields):
+        # Attach request, referring to http://niviuk.free.fr/lte_nas.php
+        self.attach_req_timestamp = log_item_dict['timestamp']
 
+        att_type = fields.get("nas_eps.emm.eps_att_type")
+        if att_type is not None:
+            attach_type = EPS_attach_type.get(att_type.get('show'))
+            if attach_type:
+                self.type = attach_type
+                self.kpi_measurements['total_number'][self.type] += 1
+            self.store_kpi("KPI_Accessibility_ATTACH_REQ",
+                           self.kpi_measurements['total_number'], log_item_dict['timestamp'])
 
+    def __on_attach_complete(self, msg, log_item_dict, fields):
+        # Attach complete, referring to http://niviuk.free.fr/lte_nas.php
+        if self.attach_req_timestamp:
+            delta = (log_item_dict['timestamp'] - self.attach_req_timestamp).total_seconds()
+            if delta >=0:
+                upload_dict = {'latency': delta}
+                # self.upload_kpi("KPI.Accessibility.ATTACH_LATENCY", upload_dict)
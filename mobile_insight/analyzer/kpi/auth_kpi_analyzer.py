@@ -10,9 +10,12 @@ Author: Zhehui Zhang
 __all__ = ["AuthKpiAnalyzer"]
 
 try:
-    import xml.etree.cElementTree as ET
+    from lxml import etree as ET
 except ImportError:
-    import xml.etree.ElementTree as ET
+    try:
+        import xml.etree.cElementTree as ET
+    except ImportError:
+        import xml.etree.ElementTree as ET
 from .kpi_analyzer import KpiAnalyzer
 
 # full list refer to Table 9.9.3.9.1 in TS 24.301
@@ -38,6 +41,13 @@ EMM_cause = {'3': 'ILL_UE',
              '39': 'CS_NOT_AVAIL',
              '40': 'NO_EPS_ACTIVATED'}
 
+# EMM causes tracked for authentication failure: cause show value -> failure counter
+AUTH_FAILURE_cause = dict((str(cause_idx), EMM_cause[str(cause_idx)]) for cause_idx in [20, 21, 26])
+
+# fields read by the callback
+AUTH_FIELDS = frozenset(["nas_eps.nas_msg_emm_type",
+                         "nas_eps.emm.cause"])
+
 class AuthKpiAnalyzer(KpiAnalyzer):
     """
     An KPI analyzer to monitor and manage RRC connection success rate
@@ -47,6 +57,7 @@ class AuthKpiAnalyzer(KpiAnalyzer):
         KpiAnalyzer.__init__(self)
 
         self.cell_id = None
+        self.__cell_info = None # TrackCellInfoAnalyzer, looked up on the first message
 
         self.kpi_measurements = {'success_number': {'TOTAL': 0}, \
                                  'total_number': {'TOTAL': 0},\
@@ -58,8 +69,8 @@ class AuthKpiAnalyzer(KpiAnalyzer):
             # TODO: find cause for Auth rej
             # self.kpi_measurements['reject_number'][EMM_cause[str(cause_idx)]] = 0
 
-        for cause_idx in [20, 21, 26]:
-            self.kpi_measurements['failure_number'][EMM_cause[str(cause_idx)]] = 0
+        for cause in AUTH_FAILURE_cause.values():
+            self.kpi_measurements['failure_number'][cause] = 0
 
         self.register_kpi("Accessibility", "AUTH_SUC", self.__emm_sr_callback,
                           list(self.kpi_measurements['success_number'].keys()))
@@ -75,6 +86,13 @@ class AuthKpiAnalyzer(KpiAnalyzer):
         # initilize kpi values
         # self.__calculate_kpi()
 
+        # (msg.type_id, show of nas_eps.nas_msg_emm_type) -> handler
+        self.__emm_handlers = {
+            ("LTE_NAS_EMM_OTA_Incoming_Packet", '82'): self.__on_auth_request,
+            ("LTE_NAS_EMM_OTA_Incoming_Packet", '84'): self.__on_auth_reject,
+            ("LTE_NAS_EMM_OTA_Outgoing_Packet", '92'): self.__on_auth_failure,
+        }
+
         # add callback function
         self.add_source_callback(self.__emm_sr_callback)
 
@@ -106,83 +124,97 @@ class AuthKpiAnalyzer(KpiAnalyzer):
                 for sub_key, sub_value in value.items():
                     value[sub_key] = 0
 
+    def __get_fields(self, log_xml):
+        """
+        Collect the fields read by the callback in a single walk of the message
+
+        :param log_xml: the parsed Msg of a NAS EMM OTA log
+        :returns: a dict of field name -> the last field with that name
+        """
+        fields = {}
+        for field in log_xml.iter('field'):
+            name = field.get('name')
+            if name in AUTH_FIELDS:
+                fields[name] = field
+        return fields
+
     def __emm_sr_callback(self, msg):
         # deal with EMM OTA
-        cell_id = self.get_analyzer('TrackCellInfoAnalyzer').get_cur_cell_id()
+        cell_info = self.__cell_info
+        if cell_info is None:
+            cell_info = self.__cell_info = self.get_analyzer('TrackCellInfoAnalyzer')
+        cell_id = cell_info.get_cur_cell_id()
         if cell_id != self.cell_id:
             self.cell_id = cell_id
             self.__clear_counters()
 
-        if msg.type_id == "LTE_NAS_EMM_OTA_Incoming_Packet":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
-            if 'Msg' in log_item_dict:
-                log_xml = ET.XML(log_item_dict['Msg'])
-                # ET.dump(log_xml)
-                for proto in log_xml.iter('proto'):
-                    if proto.get('name') == 'nas-eps':
-                        for field in proto.iter('field'):
-
-                            if field.get('name') == "nas_eps.nas_msg_emm_type":
-                                # showing '82' indicates Auth acccept, referring to http://niviuk.free.fr/lte_nas.php
-                                if field.get('show') == "82":
-                                    self.kpi_measurements['total_number']['TOTAL'] += 1
-                                    self.store_kpi("KPI_Accessibility_AUTH_REQ",
-                                                   self.kpi_measurements['total_number'], log_item_dict['timestamp'])
-
-
-                                # '84' indicates Auth reject
-                                elif field.get('show') == '84':
-                                    # for child_field in proto.iter('field'):
-                                    #     if child_field.get('name') == 'nas_eps.emm.cause':
-                                    #         cause_idx = str(child_field.get('show'))
-                                    #         if cause_idx in EMM_cause:
-                                    self.kpi_measurements['reject_number']['TOTAL'] += 1
-                                    self.store_kpi("KPI_Retainability_AUTH_REJ",
-                                                   self.kpi_measurements['reject_number'], msg.timestamp)
-                                    upload_dict = {
-                                        'total_number': self.kpi_measurements['total_number']['TOTAL'],
-                                        'reject_number': self.kpi_measurements['reject_number']['TOTAL']}
-                                    self.upload_kpi('KPI.Retainability.AUTH_REJ', upload_dict)
-
-                                    success_number = upload_dict['total_number'] - upload_dict['reject_number'] - \
-                                        sum(self.kpi_measurements['failure_number'].values())
-                                    upload_dict = {
-                                        'total_number': self.kpi_measurements['total_number']['TOTAL'],
-                                        'success_number': success_number
-                                    }
-                                    self.upload_kpi('KPI.Accessibility.AUTH_SR', upload_dict)
-                                            # else:
-                                            #     self.log_warning("Unknown EMM cause: " + cause_idx)
-
-        elif msg.type_id == "LTE_NAS_EMM_OTA_Outgoing_Packet":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
-            if 'Msg' in log_item_dict:
-                log_xml = ET.XML(log_item_dict['Msg'])
-                # ET.dump(log_xml)
-                for field in log_xml.iter('field'):
-                    # TODO: how to check it succeed?
-                    if field.get('name') == "nas_eps.nas_msg_emm_type":
-                        # '92' indicates Auth failure
-                        if field.get('show') == '92':
-                            for child_field in proto.iter('field'):
-                                if child_field.get('name') == 'nas_eps.emm.cause':
-                                    cause_idx = str(child_field.get('show'))
-                                    if cause_idx in EMM_cause:
-                                        self.kpi_measurements['failure_number'][EMM_cause[cause_idx]] += 1
-                                        self.store_kpi("KPI_Retainability_AUTH_FAIL",
-                                                       self.kpi_measurements['failure_number'], msg.timestamp)
-                                        upload_dict = {
-                                            'total_number': self.kpi_measurements['total_number']['TOTAL'],
-                                            'failure_number': self.kpi_measurements['failure_number']}
-                                        self.upload_kpi('KPI.Retainability.AUTH_FAIL', upload_dict)
-                                    else:
-                                        self.log_warning("Unknown EMM cause: " + cause_idx)
-
-        return 0
-
+        if msg.type_id != "LTE_NAS_EMM_OTA_Incoming_Packet" \
+                and msg.type_id != "LTE_NAS_EMM_OTA_Outgoing_Packet":
+            return 0
 
+        log_item_dict = msg.data.decode()
+        msg_xml = log_item_dict.get('Msg')
+        if not msg_xml:
+            return 0
 
+        log_xml = ET.XML(msg_xml)
+        # ET.dump(log_xml)
+        fields = self.__get_fields(log_xml)
+        emm_type = fields.get("nas_eps.nas_msg_emm_type")
+        if emm_type is not None:
+            handler = self.__emm_handlers.get((msg.type_id, emm_type.get('show')))
+            if handler:
+                handler(msg, log_item_dict, fields)
 
+        return 0
 
+    def __on_auth_request(self, msg, log_item_dict, fields):
+        # showing '82' indicates Auth request, referring to http://niviuk.free.fr/lte_nas.php
+        self.kpi_measurements['total_number']['TOTAL'] += 1
+        self.store_kpi("KPI_Accessibility_AUTH_REQ",
+                       self.kpi_measurements['total_number'], log_item_dict['timestamp'])
+
+    def __on_auth_reject(self, msg, log_item_dict, fields):
+        # '84' indicates Auth reject
+        # cause_field = fields.get('nas_eps.emm.cause')
+        # if cause_field is not None:
+        #     cause_idx = str(cause_field.get('show'))
+        #     if cause_idx in EMM_cause:
+        self.kpi_measurements['reject_number']['TOTAL'] += 1
+        self.store_kpi("KPI_Retainability_AUTH_REJ",
+                       self.kpi_measurements['reject_number'], msg.timestamp)
+        upload_dict = {
+            'total_number': self.kpi_measurements['total_number']['TOTAL'],
+            'reject_number': self.kpi_measurements['reject_number']['TOTAL']}
+        self.upload_kpi('KPI.Retainability.AUTH_REJ', upload_dict)
+
+        success_number = upload_dict['total_number'] - upload_dict['reject_number'] - \
+            sum(self.kpi_measurements['failure_number'].values())
+        upload_dict = {
+            'total_number': self.kpi_measurements['total_number']['TOTAL'],
+            'success_number': success_number
+        }
+        self.upload_kpi('KPI.Accessibility.AUTH_SR', upload_dict)
+        #     else:
+        #         self.log_warning("Unknown EMM cause: " + cause_idx)
+
+    def __on_auth_failure(self, msg, log_item_dict, fields):
+        # '92' indicates Auth failure
+        # TODO: how to check it succeed?
+        cause_field = fields.get('nas_eps.emm.cause')
+        if cause_field is None:
+            return
+        cause_idx = str(cause_field.get('show'))
+        cause = AUTH_FAILURE_cause.get(cause_idx)
+        if cause:
+            self.kpi_measurements['failure_number'][cause] += 1
+            self.store_kpi("KPI_Retainability_AUTH_FAIL",
+                           self.kpi_measurements['failure_number'], msg.timestamp)
+            upload_dict = {
+                'total_number': self.kpi_measurements['total_number']['TOTAL'],
+                'failure_number': self.kpi_measurements['failure_number']}
+            self.upload_kpi('KPI.Retainability.AUTH_FAIL', upload_dict)
+        elif cause_idx in EMM_cause:
+            self.log_warning("Untracked EMM cause: " + EMM_cause[cause_idx])
+        else:
+            self.log_warning("Unknown EMM cause: " + cause_idx)
@@ -10,11 +10,19 @@ Author: Zhehui Zhang
 __all__ = ["HoSrAnalyzer"]
 
 try:
-    import xml.etree.cElementTree as ET
+    from lxml import etree as ET
 except ImportError:
-    import xml.etree.ElementTree as ET
+    try:
+        import xml.etree.cElementTree as ET
+    except ImportError:
+        import xml.etree.ElementTree as ET
 from .kpi_analyzer import KpiAnalyzer
 
+# RRC fields the callback acts on; messages carrying neither are not parsed.
+# reestablishmentCause only occurs in RRCConnectionReestablishmentRequest
+HO_FAILURE_CAUSE = "lte-rrc.reestablishmentCause"
+HO_COMMAND_ELEMENT = "lte-rrc.mobilityControlInfo_element"
+
 
 class HoSrAnalyzer(KpiAnalyzer):
     """
@@ -50,23 +58,22 @@ class HoSrAnalyzer(KpiAnalyzer):
         # deal with RRC OTA
 
         if msg.type_id == "LTE_RRC_OTA_Packet":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
-            if 'Msg' in log_item_dict:
-                log_xml = ET.XML(log_item_dict['Msg'])
+            log_item_dict = msg.data.decode()
+            msg_xml = log_item_dict.get('Msg')
+            # most RRC messages carry neither field, skip parsing them
+            if msg_xml and (HO_FAILURE_CAUSE in msg_xml or HO_COMMAND_ELEMENT in msg_xml):
+                log_xml = ET.XML(msg_xml)
                 for field in log_xml.iter('field'):
- 
-                    if field.get('name') == "lte-rrc.rrcConnectionReestablishmentRequest_element":
+                    name = field.get('name')
+
+                    if name == HO_FAILURE_CAUSE:
                         # <field name="lte-rrc.reestablishmentCause" pos="13" show="1" showname="reestablishmentCause: handoverFailure (1)" size="1" value="04" />
-                        tag = 'failure'
-                        for val in field.iter('field'):
-                            if val.get('name') == 'lte-rrc.reestablishmentCause':
-                                if int(val.get('show')) == 1:
-                                    tag = 'handover_failure'
-                                    self.store_kpi("KPI_Mobility_HO_FAILURE", str(self.kpi_measurements['failure_number']), log_item_dict['timestamp'])
-                                
-
-                    elif field.get('name') == "lte-rrc.mobilityControlInfo_element":
+                        if int(field.get('show')) == 1:
+                            self.kpi_measurements['failure_number'] += 1
+                            self.store_kpi("KPI_Mobility_HO_FAILURE", str(self.kpi_measurements['failure_number']), log_item_dict['timestamp'])
+
+                    elif name == HO_COMMAND_ELEMENT:
+                        self.kpi_measurements['total_number'] += 1
                         self.store_kpi("KPI_Mobility_HO_TOTAL", str(self.kpi_measurements['total_number']), log_item_dict['timestamp'])
 
         return 0
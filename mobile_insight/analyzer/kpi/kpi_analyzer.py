@@ -30,6 +30,7 @@ from ..analyzer import *
 import os, errno
 import urllib.request, urllib.error, urllib.parse, json, time, datetime
 import threading
+import atexit
 from collections import deque
 
 
@@ -49,11 +50,22 @@ class KpiAnalyzer(Analyzer):
     upload_thread = None
     pending_upload_task = deque([]) # (kpi_name, kpi_val) pair list
 
+    # Global variables: Local database connection shared by all KPI analyzers (laptop version).
+    # KPI inserts are committed in batches of commit_batch rather than one by one,
+    # or once commit_interval seconds have passed since the last commit (checked on
+    # every source message, so that a low-rate source does not hold KPIs uncommitted)
+    db_conn = None
+    pending_commits = 0
+    commit_batch = 64
+    commit_interval = 1.0
+    last_commit = 0.0
+
 
     def __init__(self):
 
         Analyzer.__init__(self)
         self.include_analyzer('TrackCellInfoAnalyzer', [])
+        self.add_source_callback(self.__commit_callback)
 
         # initilize local database
         self.supported_kpis = {} # Supported KPIs: kpi_name -> callback
@@ -62,6 +74,7 @@ class KpiAnalyzer(Analyzer):
         self.__op = ""
         self.__phone_model = ""
         self.__db_enabled = False
+        self.__db_warned = False # whether the "database not enabled" warning was logged
         self.__periodicity = {}
         self.__logcell = {}
         self.__last_updated = {}
@@ -144,7 +157,8 @@ class KpiAnalyzer(Analyzer):
             self.__db.execSQL(sql_cmd)
         else:
             self.__db.execute(sql_cmd)
-            self.__conn.commit()
+            # commit through flush_kpi() so that pending_commits stays accurate
+            KpiAnalyzer.flush_kpi()
 
 
     def __create_db(self):
@@ -180,7 +194,10 @@ class KpiAnalyzer(Analyzer):
                 except OSError as exception:
                     if exception.errno != errno.EEXIST:
                         raise
-                self.__conn = sqlite3.connect('./dbs/' + db_name + '.db')
+                if not KpiAnalyzer.db_conn:
+                    KpiAnalyzer.db_conn = sqlite3.connect('./dbs/' + db_name + '.db')
+                    atexit.register(KpiAnalyzer.flush_kpi)
+                self.__conn = KpiAnalyzer.db_conn
                 self.__db = self.__conn.cursor()
             return True
         except BaseException:  # TODO: raise warnings
@@ -439,7 +456,10 @@ class KpiAnalyzer(Analyzer):
         :type timestamp: datetime
         """
         if not self.__db_enabled:
-            self.log_warning("Database is not enabled.")
+            # store_kpi runs once per KPI event; warn only on the first call
+            if not self.__db_warned:
+                self.__db_warned = True
+                self.log_warning("Database is not enabled.")
             return True
 
         # try:
@@ -516,13 +536,43 @@ class KpiAnalyzer(Analyzer):
             self.__db.execSQL(sql_cmd)
         else:
             self.__db.execute(sql_cmd)
-            self.__conn.commit()
+            KpiAnalyzer.pending_commits += 1
+            if KpiAnalyzer.pending_commits >= KpiAnalyzer.commit_batch \
+                    or time.time() - KpiAnalyzer.last_commit >= KpiAnalyzer.commit_interval:
+                KpiAnalyzer.flush_kpi()
 
         self.__log_kpi(kpi_name, timestamp, cell_id, kpi_value)
         return True
         # except BaseException:  # TODO: raise warnings
             # return False
 
+    def __commit_callback(self, msg):
+        """
+        Commit the pending KPIs once commit_interval seconds have passed since the last
+        commit, even if no further KPI is stored.
+        It runs on every source message, i.e., in the thread that owns the connection.
+        """
+        if KpiAnalyzer.pending_commits \
+                and time.time() - KpiAnalyzer.last_commit >= KpiAnalyzer.commit_interval:
+            KpiAnalyzer.flush_kpi()
+
+    @staticmethod
+    def flush_kpi():
+        """
+        Commit the KPIs stored since the last commit to the local database (laptop version).
+
+        It is called automatically every commit_batch KPIs, on the first source message
+        commit_interval seconds after the last commit, and at interpreter exit.
+        Exit handlers do not run in multiprocessing workers, after os._exit() or when
+        the process is killed, so callers should call it once the replay/monitoring
+        ends, e.g., right after src.run().
+        Otherwise up to commit_batch - 1 stored KPIs may be lost.
+        """
+        if KpiAnalyzer.db_conn and (KpiAnalyzer.pending_commits or KpiAnalyzer.db_conn.in_transaction):
+            KpiAnalyzer.db_conn.commit()
+            KpiAnalyzer.pending_commits = 0
+            KpiAnalyzer.last_commit = time.time()
+
     def __log_kpi(self, kpi_name, timestamp, cell_id, kpi_value):
         """
         :param kpi_name: The KPI to be queried
@@ -93,6 +93,26 @@ class KPIManager(Analyzer):
             return False
 
 
+    def enable_kpis(self, kpi_names, periodicity='0s', cell=None, enable_storage = True):
+        """
+        Enable the monitoring of a batch of KPIs with the same settings
+
+        :param kpi_names: The KPIs to be monitored, enabled in the given order
+        :type kpi_names: iterable of string
+        :param periodicity: The minimum interval between two logged values of each KPI (s,m,h,d represents scale of seconds, minutes, hours, days). '0s' by default
+        :type periodicity: string
+        :param cell: Only log the KPIs observed in this cell ID, or in any cell if None. None by default
+        :type cell: string
+        :param enable_storage: Whether to locally store the KPIs. True by default
+        :type enable_storage: boolean
+        :returns: True if all KPIs are successfully activated, False otherwise
+        """
+        res = True
+        for kpi_name in kpi_names:
+            res = self.enable_kpi(kpi_name, periodicity, cell, enable_storage) and res
+        return res
+
+
     def local_query_kpi(self, kpi_name, mode = 'cell', timestamp = None):
         """
         Query the phone's locally observed KPI
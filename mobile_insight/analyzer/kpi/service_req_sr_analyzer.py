@@ -10,9 +10,12 @@ Author: Zhehui Zhang
 __all__ = ["ServiceReqSrAnalyzer"]
 
 try:
-    import xml.etree.cElementTree as ET
+    from lxml import etree as ET
 except ImportError:
-    import xml.etree.ElementTree as ET
+    try:
+        import xml.etree.cElementTree as ET
+    except ImportError:
+        import xml.etree.ElementTree as ET
 from .kpi_analyzer import KpiAnalyzer
 
 EMM_cause = {'3': 'ILL_UE',
@@ -34,6 +37,10 @@ EMM_cause = {'3': 'ILL_UE',
              '39': 'CS_NOT_AVAIL',
              '40': 'NO_EPS_ACTIVATED'}
 
+# EMM causes tracked for service reject: cause show value -> reject counter
+SR_REJECT_cause = dict((str(cause_idx), EMM_cause[str(cause_idx)])
+                       for cause_idx in [3, 6, 7] + list(range(9, 16)) + [18, 22, 25, 39, 40])
+
 class ServiceReqSrAnalyzer(KpiAnalyzer):
     """
     An KPI analyzer to monitor and manage tracking area update success rate
@@ -47,8 +54,8 @@ class ServiceReqSrAnalyzer(KpiAnalyzer):
         self.kpi_measurements = {'success_number': {'TOTAL': 0}, \
                                  'total_number': {'TOTAL': 0}, \
                                  'reject_number': {}}
-        for cause_idx in [3, 6, 7] + list(range(9, 16)) + [18, 22, 25, 39, 40]:
-            self.kpi_measurements['reject_number'][EMM_cause[str(cause_idx)]] = 0
+        for cause in SR_REJECT_cause.values():
+            self.kpi_measurements['reject_number'][cause] = 0
 
         # print self.kpi_measurements
 
@@ -106,8 +113,7 @@ class ServiceReqSrAnalyzer(KpiAnalyzer):
             self.__clear_counters()
 
         if msg.type_id == "LTE_NAS_ESM_State":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
+            log_item_dict = msg.data.decode()
             if self.service_req_flag and int(log_item_dict["EPS bearer state"]) == 2:
                 self.kpi_measurements['success_number']['TOTAL'] += 1
                 self.service_req_flag = False
@@ -122,37 +128,45 @@ class ServiceReqSrAnalyzer(KpiAnalyzer):
                                # '{:.2f}'.format(self.current_kpi['TOTAL']), msg.timestamp)
 
         elif msg.type_id == "LTE_NAS_EMM_OTA_Incoming_Packet":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
+            log_item_dict = msg.data.decode()
             # print log_item_dict
             if 'Msg' in log_item_dict:
                 log_xml = ET.XML(log_item_dict['Msg'])
                 # print ET.dump(log_xml)
+                # walk the nas-eps fields once, then act on the collected values
+                emm_type = None
+                cause_field = None
                 for proto in log_xml.iter('proto'):
                     if proto.get('name') == 'nas-eps':
                         for field in proto.iter('field'):
-                            # '4d' indicates Service request
-                            if field.get('name') == 'nas_eps.nas_msg_emm_type' and field.get('value') == '4d' and self.service_req_flag:
-                                for child_field in proto.iter('field'):
-                                    if child_field.get('name') == 'nas_eps.emm.cause':
-                                        cause_idx = str(child_field.get('show'))
-                                        if cause_idx in EMM_cause:
-                                            self.kpi_measurements['reject_number'][EMM_cause[cause_idx]] += 1
-                                            # self.log_info("SR_SR: " + str(self.kpi_measurements))
-                                            self.store_kpi("KPI_Retainability_SR_REJ",
-                                                           self.kpi_measurements['reject_number'], log_item_dict['timestamp'])
-                                            upload_dict = {
-                                                'total_number': self.kpi_measurements['total_number']['TOTAL'],
-                                                'reject_number': self.kpi_measurements['reject_number']}
-                                            # self.upload_kpi('KPI.Retainability.SR_REJ', upload_dict)
-                                            # self.log_info("SR_REJ: " + str(self.kpi_measurements))
-                                        else:
-                                            self.log_warning("Unknown EMM cause for SR reject: " + cause_idx)
-                                        self.service_req_flag = False
+                            name = field.get('name')
+                            if name == 'nas_eps.nas_msg_emm_type':
+                                emm_type = field.get('value')
+                            elif name == 'nas_eps.emm.cause':
+                                cause_field = field
+
+                # '4d' indicates Service request
+                if emm_type == '4d' and self.service_req_flag and cause_field is not None:
+                    cause_idx = str(cause_field.get('show'))
+                    cause = SR_REJECT_cause.get(cause_idx)
+                    if cause:
+                        self.kpi_measurements['reject_number'][cause] += 1
+                        # self.log_info("SR_SR: " + str(self.kpi_measurements))
+                        self.store_kpi("KPI_Retainability_SR_REJ",
+                                       self.kpi_measurements['reject_number'], log_item_dict['timestamp'])
+                        upload_dict = {
+                            'total_number': self.kpi_measurements['total_number']['TOTAL'],
+                            'reject_number': self.kpi_measurements['reject_number']}
+                        # self.upload_kpi('KPI.Retainability.SR_REJ', upload_dict)
+                        # self.log_info("SR_REJ: " + str(self.kpi_measurements))
+                    elif cause_idx in EMM_cause:
+                        self.log_warning("Untracked EMM cause for SR reject: " + EMM_cause[cause_idx])
+                    else:
+                        self.log_warning("Unknown EMM cause for SR reject: " + cause_idx)
+                    self.service_req_flag = False
 
         elif msg.type_id == "LTE_NAS_EMM_OTA_Outgoing_Packet":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
+            log_item_dict = msg.data.decode()
             if 'Msg' in log_item_dict:
                 log_xml = ET.XML(log_item_dict['Msg'])
                 for proto in log_xml.iter('proto'):
@@ -162,6 +176,8 @@ class ServiceReqSrAnalyzer(KpiAnalyzer):
                                 self.kpi_measurements['total_number']['TOTAL'] += 1
                                 self.service_req_flag = True
                                 self.store_kpi("KPI_Accessibility_SR_REQ", self.kpi_measurements['total_number'], log_item_dict['timestamp'])
+                                # the header type is only 'C' for a Service request, skip the remaining fields
+                                break
 
 
 
@@ -10,9 +10,12 @@ Author: Zhehui Zhang
 __all__ = ["TauSrAnalyzer"]
 
 try:
-    import xml.etree.cElementTree as ET
+    from lxml import etree as ET
 except ImportError:
-    import xml.etree.ElementTree as ET
+    try:
+        import xml.etree.cElementTree as ET
+    except ImportError:
+        import xml.etree.ElementTree as ET
 from .kpi_analyzer import KpiAnalyzer
 
 # full list refer to Table 9.9.3.9.1 in TS 24.301
@@ -35,6 +38,14 @@ EMM_cause = {'3': 'ILL_UE',
              '39': 'CS_NOT_AVAIL',
              '40': 'NO_EPS_ACTIVATED'}
 
+# EMM causes tracked for TAU reject: cause show value -> reject counter
+TAU_REJECT_cause = dict((str(cause_idx), EMM_cause[str(cause_idx)])
+                        for cause_idx in [3, 6, 7] + list(range(9, 16)) + [22, 25, 40])
+
+# fields read by the callback
+TAU_FIELDS = frozenset(["nas_eps.nas_msg_emm_type",
+                        "nas_eps.emm.cause"])
+
 class TauSrAnalyzer(KpiAnalyzer):
     """
     An KPI analyzer to monitor and manage tracking area update success rate
@@ -48,8 +59,8 @@ class TauSrAnalyzer(KpiAnalyzer):
         self.kpi_measurements = {'success_number': {'TOTAL': 0}, \
                                  'total_number': {'TOTAL': 0},\
                                  'reject_number': {}}
-        for cause_idx in [3, 6, 7] + list(range(9, 16)) + [22, 25, 40]:
-            self.kpi_measurements['reject_number'][EMM_cause[str(cause_idx)]] = 0
+        for cause in TAU_REJECT_cause.values():
+            self.kpi_measurements['reject_number'][cause] = 0
 
         # print self.kpi_measurements
 
@@ -71,6 +82,13 @@ class TauSrAnalyzer(KpiAnalyzer):
         # initilize kpi values
         # self.__calculate_kpi()
 
+        # (msg.type_id, value of nas_eps.nas_msg_emm_type) -> handler
+        self.__emm_handlers = {
+            ("LTE_NAS_EMM_OTA_Incoming_Packet", '49'): self.__on_tau_accept,
+            ("LTE_NAS_EMM_OTA_Incoming_Packet", '4b'): self.__on_tau_reject,
+            ("LTE_NAS_EMM_OTA_Outgoing_Packet", '48'): self.__on_tau_request,
+        }
+
         # add callback function
         self.add_source_callback(self.__emm_sr_callback)
 
@@ -112,75 +130,88 @@ class TauSrAnalyzer(KpiAnalyzer):
             self.__clear_counters()
 
         if msg.type_id == "LTE_NAS_EMM_OTA_Incoming_Packet":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
-            # print log_item_dict
-            if 'Msg' in log_item_dict:
-                log_xml = ET.XML(log_item_dict['Msg'])
-                # print ET.dump(log_xml)
-                for proto in log_xml.iter('proto'):
-                    if proto.get('name') == 'nas-eps':
-                        for field in proto.iter('field'):
-                            # '49' indicates Tracking area update accept
-                            if field.get('name') == 'nas_eps.nas_msg_emm_type' and field.get('value') == '49' and self.tau_req_flag:
-                                self.kpi_measurements['success_number']['TOTAL'] += 1
-
-                                # self.__calculate_kpi()
-                                # self.log_info("TAU_SR: " + str(self.kpi_measurements))
-                                self.store_kpi("KPI_Mobility_TAU_SUC",
-                                            self.kpi_measurements['success_number'], log_item_dict['timestamp'])
-                                upload_dict = {
-                                    'total_number': self.kpi_measurements['total_number']['TOTAL'],
-                                    'success_number': self.kpi_measurements['success_number']['TOTAL']}
-                                self.upload_kpi('KPI.Mobility.TAU_SR', upload_dict)
-                                self.tau_req_flag = False
-
-                                # TAU latency
-                                delta_time = (log_item_dict['timestamp']-self.tau_req_timestamp).total_seconds()
-                                if delta_time >= 0:
-                                    upload_dict = {'latency': delta_time}
-                                    self.upload_kpi("KPI.Mobility.TAU_SR_LATENCY", upload_dict)
-
-                            # '4b' indicates Tracking area update reject
-                            elif field.get('name') == 'nas_eps.nas_msg_emm_type' and field.get('value') == '4b' and self.tau_req_flag:
-                                for child_field in proto.iter('field'):
-                                    if child_field.get('name') == 'nas_eps.emm.cause':
-                                        cause_idx = str(child_field.get('show'))
-                                        if cause_idx in EMM_cause:
-                                            self.kpi_measurements['reject_number'][EMM_cause[cause_idx]] += 1
-                                            # self.log_info("TAU_SR: " + str(self.kpi_measurements))
-                                            self.store_kpi("KPI_Retainability_TAU_REJ",
-                                                           self.kpi_measurements['reject_number'], log_item_dict['timestamp'])
-                                            upload_dict = {
-                                                'total_number': self.kpi_measurements['total_number']['TOTAL'],
-                                                'reject_number': self.kpi_measurements['reject_number']}
-                                            # self.upload_kpi('KPI.Retainability.RRC_AB_REL', upload_dict, log_item_dict['timestamp'])
-                                            self.upload_kpi('KPI.Retainability.TAU_REJ', upload_dict)
-                                        else:
-                                            self.log_warning("Unknown EMM cause for TAU reject: " + cause_idx)
-                                        self.tau_req_flag = False
-
+            incoming = True
         elif msg.type_id == "LTE_NAS_EMM_OTA_Outgoing_Packet":
-            log_item = msg.data.decode()
-            log_item_dict = dict(log_item)
-            # print log_item_dict
-            if 'Msg' in log_item_dict:
-                log_xml = ET.XML(log_item_dict['Msg'])
-                # print ET.dump(log_xml)
-                for proto in log_xml.iter('proto'):
-                    if proto.get('name') == 'nas-eps':
-                        for field in proto.iter('field'):
-                            # '48' indicates Tracking area update request
-                            if field.get('name') == 'nas_eps.nas_msg_emm_type' and field.get('value') == '48':
-                                self.kpi_measurements['total_number']['TOTAL'] += 1
-                                # self.log_info("TAU_SR: " + str(self.kpi_measurements))
-                                self.tau_req_flag = True
-                                self.tau_req_timestamp = log_item_dict['timestamp']
-                                self.store_kpi("KPI_Mobility_TAU_REQ",
-                                               self.kpi_measurements['total_number'], log_item_dict['timestamp'])
-
-
-
-
-
+            incoming = False
+        else:
+            return 0
+
+        log_item_dict = msg.data.decode()
+        # print log_item_dict
+        if 'Msg' in log_item_dict:
+            log_xml = ET.XML(log_item_dict['Msg'])
+            # print ET.dump(log_xml)
+            # walk the nas-eps fields once, then dispatch on the EMM message type
+            fields = {}
+            for proto in log_xml.iter('proto'):
+                if proto.get('name') == 'nas-eps':
+                    for field in proto.iter('field'):
+                        name = field.get('name')
+                        if name in TAU_FIELDS:
+                            fields[name] = field
+                            # a message carries a single EMM message type, and only
+                            # incoming messages need the cause that may follow it
+                            if name == 'nas_eps.nas_msg_emm_type' and not incoming:
+                                break
+
+            emm_type = fields.get('nas_eps.nas_msg_emm_type')
+            if emm_type is not None:
+                handler = self.__emm_handlers.get((msg.type_id, emm_type.get('value')))
+                if handler:
+                    handler(msg, log_item_dict, fields)
+
+        return 0
+
+    def __on_tau_accept(self, msg, log_item_dict, fields):
+        # '49' indicates Tracking area update accept
+        if not self.tau_req_flag:
+            return
+        self.kpi_measurements['success_number']['TOTAL'] += 1
 
+        # self.__calculate_kpi()
+        # self.log_info("TAU_SR: " + str(self.kpi_measurements))
+        self.store_kpi("KPI_Mobility_TAU_SUC",
+                    self.kpi_measurements['success_number'], log_item_dict['timestamp'])
+        upload_dict = {
+            'total_number': self.kpi_measurements['total_number']['TOTAL'],
+            'success_number': self.kpi_measurements['success_number']['TOTAL']}
+        self.upload_kpi('KPI.Mobility.TAU_SR', upload_dict)
+        self.tau_req_flag = False
+
+        # TAU latency
+        delta_time = (log_item_dict['timestamp']-self.tau_req_timestamp).total_seconds()
+        if delta_time >= 0:
+            upload_dict = {'latency': delta_time}
+            self.upload_kpi("KPI.Mobility.TAU_SR_LATENCY", upload_dict)
+
+    def __on_tau_reject(self, msg, log_item_dict, fields):
+        # '4b' indicates Tracking area update reject
+        cause_field = fields.get('nas_eps.emm.cause')
+        if not self.tau_req_flag or cause_field is None:
+            return
+        cause_idx = str(cause_field.get('show'))
+        cause = TAU_REJECT_cause.get(cause_idx)
+        if cause:
+            self.kpi_measurements['reject_number'][cause] += 1
+            # self.log_info("TAU_SR: " + str(self.kpi_measurements))
+            self.store_kpi("KPI_Retainability_TAU_REJ",
+                           self.kpi_measurements['reject_number'], log_item_dict['timestamp'])
+            upload_dict = {
+                'total_number': self.kpi_measurements['total_number']['TOTAL'],
+                'reject_number': self.kpi_measurements['reject_number']}
+            # self.upload_kpi('KPI.Retainability.RRC_AB_REL', upload_dict, log_item_dict['timestamp'])
+            self.upload_kpi('KPI.Retainability.TAU_REJ', upload_dict)
+        elif cause_idx in EMM_cause:
+            self.log_warning("Untracked EMM cause for TAU reject: " + EMM_cause[cause_idx])
+        else:
+            self.log_warning("Unknown EMM cause for TAU reject: " + cause_idx)
+        self.tau_req_flag = False
+
+    def __on_tau_request(self, msg, log_item_dict, fields):
+        # '48' indicates Tracking area update request
+        self.kpi_measurements['total_number']['TOTAL'] += 1
+        # self.log_info("TAU_SR: " + str(self.kpi_measurements))
+        self.tau_req_flag = True
+        self.tau_req_timestamp = log_item_dict['timestamp']
+        self.store_kpi("KPI_Mobility_TAU_REQ",
+                       self.kpi_measurements['total_number'], log_item_dict['timestamp'])
@@ -69,6 +69,7 @@ class OfflineReplayer(Monitor):
         DMLogPacket.init(prefs)
 
         self._type_names = []
+        self._type_name_set = frozenset()  # for per-packet membership tests
 
     def __del__(self):
         if self.is_android and self.service_context:
@@ -117,6 +118,7 @@ class OfflineReplayer(Monitor):
             if n not in self._type_names:
                 self._type_names.append(n)
                 self.log_info("Enable " + n)
+        self._type_name_set = frozenset(self._type_names)
         dm_collector_c.set_filtered(self._type_names)
 
     def enable_log_all(self):
@@ -179,7 +181,9 @@ class OfflineReplayer(Monitor):
             for file in log_list:
                 self.log_info("Loading " + file)
                 self.log_info('Loading: ' + str(time.time()))
-                self._input_file = open(file, "rb")
+                # Packets are fed in 64-byte slices; a large buffer keeps
+                # that from turning into a read syscall every few slices
+                self._input_file = open(file, "rb", buffering=1 << 20)
                 dm_collector_c.reset()
                 while True:
                     s = self._input_file.read(64)
@@ -202,7 +206,7 @@ class OfflineReplayer(Monitor):
                             after_decode_time = time.time()
                             decoding_inter += after_decode_time - before_decode_time
 
-                            if type_id in self._type_names or type_id == "Custom_Packet":
+                            if type_id in self._type_name_set or type_id == "Custom_Packet":
                                 event = Event(timeit.default_timer(),
                                               type_id,
                                               packet)